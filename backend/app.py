@@ -3,21 +3,39 @@ Resume Tailorer Backend
 Flask server with Perplexity API integration and RAG system
 """
 
+import hashlib
+import mmap
 import os
 import json
 import re
 import shutil
 import subprocess
 import tempfile
+from collections import Counter
+from concurrent.futures import ProcessPoolExecutor
 from uuid import uuid4
 
-from flask import Flask, request, jsonify, send_from_directory, url_for
+import numpy as np
+from flask import Flask, Request, Response, request, jsonify, send_from_directory, url_for
 from flask_cors import CORS
 from werkzeug.utils import secure_filename
 import requests
+from requests.adapters import HTTPAdapter, Retry
 from pathlib import Path
 
+
+class TexUploadRequest(Request):
+    """
+    Request with the multipart parser bounded for our workload: uploads are
+    single small .tex files, so cap the number of form parts and keep only a
+    small amount of form data in memory.
+    """
+    max_form_parts = 4
+    max_form_memory_size = 64 * 1024
+
+
 app = Flask(__name__)
+app.request_class = TexUploadRequest
 CORS(app, origins=["chrome-extension://*"])
 
 # Configuration
@@ -27,30 +45,98 @@ SAVED_RESUME_FILE = Path(__file__).parent / 'main.tex'
 COMPILED_FOLDER = UPLOAD_FOLDER / 'compiled'
 ALLOWED_EXTENSIONS = {'tex'}
 
+# When set, compiled PDFs are handed off to nginx via X-Accel-Redirect
+# instead of being streamed through the Flask worker. Point it at an
+# internal location that aliases COMPILED_FOLDER, e.g.
+#   location /internal-compiled/ { internal; alias /app/backend/uploads/compiled/; }
+# and set COMPILED_ACCEL_PREFIX=/internal-compiled
+COMPILED_ACCEL_PREFIX = os.environ.get('COMPILED_ACCEL_PREFIX')
+
 UPLOAD_FOLDER.mkdir(exist_ok=True)
 COMPILED_FOLDER.mkdir(parents=True, exist_ok=True)
 
 app.config['UPLOAD_FOLDER'] = UPLOAD_FOLDER
-app.config['MAX_CONTENT_LENGTH'] = 16 * 1024 * 1024  # 16MB max
+app.config['MAX_CONTENT_LENGTH'] = 256 * 1024  # LaTeX resumes are tiny; reject anything bigger early
 
-# Store current resume content in memory (in production, use a database)
+# Current resume state. The content lives in a read-only mmap over
+# SAVED_RESUME_FILE rather than a Python string, so every worker shares the
+# OS page cache instead of each holding its own copy (and sees the same
+# bytes after an upload).
 current_resume = {
-    'content': '',
+    'mmap': None,
     'filename': '',
-    'file_type': ''
+    'file_type': '',
+    'preamble': ''
 }
 
 
+def _mmap_saved_resume():
+    """(Re)map SAVED_RESUME_FILE into current_resume, closing any old map."""
+    old_mm = current_resume['mmap']
+    current_resume['mmap'] = None
+    current_resume['preamble'] = ''
+    if old_mm is not None:
+        old_mm.close()
+    if SAVED_RESUME_FILE.stat().st_size == 0:
+        return False  # mmap cannot map an empty file
+    with open(SAVED_RESUME_FILE, 'rb') as f:
+        current_resume['mmap'] = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+    # The preamble only changes when the resume does, so extract it once
+    # here instead of re-scanning the content on every model response
+    current_resume['preamble'] = extract_preamble_from_original(resume_content())
+    return True
+
+
+def resume_loaded():
+    return current_resume['mmap'] is not None
+
+
+def resume_content():
+    """Full resume text decoded from the shared mapping."""
+    mm = current_resume['mmap']
+    return bytes(mm[:]).decode('utf-8') if mm is not None else ''
+
+
+def resume_preview(limit=500):
+    """First `limit` characters of the resume, read straight off the map."""
+    mm = current_resume['mmap']
+    if mm is None:
+        return ''
+    preview = bytes(mm[:limit]).decode('utf-8', 'ignore')
+    return preview + '...' if len(mm) > limit else preview
+
+# Single alternation pattern for extract_latex_from_response (hot path:
+# called once per optimization iteration). One finditer pass locates every
+# sentinel — fence delimiters and the document markers — instead of
+# re-scanning the response for each pattern separately.
+_EXTRACT_RE = re.compile(
+    r'(?P<fence>```(?:latex|tex)?[ \t]*\n?)'
+    r'|(?P<docclass>\\documentclass)'
+    r'|(?P<begin>\\begin\{document\})'
+    r'|(?P<end>\\end\{document\})',
+    re.IGNORECASE
+)
+
+# Shared session for Perplexity calls so retries within a single /tailor
+# request reuse one keep-alive connection instead of paying a fresh
+# TCP/TLS handshake per call
+_PPLX_SESSION = requests.Session()
+_PPLX_SESSION.mount('https://', HTTPAdapter(
+    pool_connections=4,
+    pool_maxsize=8,
+    max_retries=Retry(total=2, backoff_factor=0.3, status_forcelist=[502, 503, 504])
+))
+
+
 def load_saved_resume():
     """Load persisted resume on startup if it exists"""
     if SAVED_RESUME_FILE.exists():
         try:
-            content = SAVED_RESUME_FILE.read_text(encoding='utf-8')
-            current_resume['content'] = content
-            current_resume['filename'] = SAVED_RESUME_FILE.name
-            current_resume['file_type'] = 'tex'
-            print(f"Loaded saved resume: {SAVED_RESUME_FILE.name}")
-            return True
+            if _mmap_saved_resume():
+                current_resume['filename'] = SAVED_RESUME_FILE.name
+                current_resume['file_type'] = 'tex'
+                print(f"Loaded saved resume: {SAVED_RESUME_FILE.name}")
+                return True
         except Exception as e:
             print(f"Error loading saved resume: {e}")
     return False
@@ -58,10 +144,18 @@ def load_saved_resume():
 
 def save_resume_to_disk(content):
     """Persist resume to disk so it loads automatically next time"""
+    # Write to a sibling temp file and rename into place so a crash
+    # mid-write can never leave a truncated main.tex behind
+    tmp_path = SAVED_RESUME_FILE.with_suffix('.tex.tmp')
     try:
-        SAVED_RESUME_FILE.write_text(content, encoding='utf-8')
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            f.write(content)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, SAVED_RESUME_FILE)
         print(f"Resume saved to: {SAVED_RESUME_FILE}")
     except Exception as e:
+        tmp_path.unlink(missing_ok=True)
         print(f"Error saving resume: {e}")
 
 
@@ -75,12 +169,23 @@ def extract_tex_text(filepath):
         return file.read()
 
 
+# Cached RAG context: {(st_mtime_ns, st_size): content}. The file rarely
+# changes, so only re-read it when its stat signature does.
+_RAG_CACHE = {}
+
+
 def load_rag_context():
     """Load the RAG context file containing additional user info"""
-    if RAG_FILE.exists():
+    try:
+        st = RAG_FILE.stat()
+    except FileNotFoundError:
+        return ""
+    key = (st.st_mtime_ns, st.st_size)
+    if key not in _RAG_CACHE:
+        _RAG_CACHE.clear()
         with open(RAG_FILE, 'r', encoding='utf-8') as file:
-            return file.read()
-    return ""
+            _RAG_CACHE[key] = file.read()
+    return _RAG_CACHE[key]
 
 
 def query_perplexity(prompt, system_prompt):
@@ -105,7 +210,7 @@ def query_perplexity(prompt, system_prompt):
         "max_tokens": 4096
     }
     
-    response = requests.post(
+    response = _PPLX_SESSION.post(
         "https://api.perplexity.ai/chat/completions",
         headers=headers,
         json=payload,
@@ -126,94 +231,129 @@ def extract_preamble_from_original(original_tex):
     return ""
 
 
-def extract_latex_from_response(response_text, original_tex=""):
+def extract_latex_from_response(response_text, original_preamble=""):
     """
     Extract pure LaTeX from Perplexity response.
     The model may wrap the code in markdown fences or add explanatory text.
-    If the response is missing the preamble, use the original resume's preamble.
+    If the response is missing the preamble, splice in `original_preamble`
+    (extracted once at upload time, not re-scanned per response).
+    Runs a single scan over the response, classifying every sentinel
+    (fence delimiters, \\documentclass, \\begin/\\end{document}) in one pass.
     """
     text = response_text.strip()
-    
-    # Try multiple patterns to extract from markdown code fences
-    fence_patterns = [
-        r'```latex\s*\n(.*?)```',
-        r'```tex\s*\n(.*?)```',
-        r'```\s*\n(.*?)```',
-        r'```(.*?)```',
-    ]
-    
-    for pattern in fence_patterns:
-        match = re.search(pattern, text, re.DOTALL | re.IGNORECASE)
-        if match:
-            extracted = match.group(1).strip()
-            if '\\documentclass' in extracted or '\\begin{document}' in extracted:
-                text = extracted
-                break
-    
-    # Find \documentclass and extract from there
-    if '\\documentclass' in text:
-        start = text.find('\\documentclass')
-        text = text[start:]
-    elif '\\begin{document}' in text:
+
+    fence_tokens = []  # (start, end) of each ``` delimiter
+    docclass_starts = []
+    begin_starts = []
+    end_spans = []  # (start, end) of each \end{document}
+    for match in _EXTRACT_RE.finditer(text):
+        kind = match.lastgroup
+        if kind == 'fence':
+            fence_tokens.append((match.start(), match.end()))
+        elif kind == 'docclass':
+            docclass_starts.append(match.start())
+        elif kind == 'begin':
+            begin_starts.append(match.start())
+        else:
+            end_spans.append((match.start(), match.end()))
+
+    # If the code is wrapped in markdown fences, narrow to the first fenced
+    # region that actually contains a LaTeX document
+    lo, hi = 0, len(text)
+    for i in range(0, len(fence_tokens) - 1, 2):
+        content_lo, content_hi = fence_tokens[i][1], fence_tokens[i + 1][0]
+        if any(content_lo <= p < content_hi for p in docclass_starts) or \
+           any(content_lo <= p < content_hi for p in begin_starts):
+            lo, hi = content_lo, content_hi
+            break
+
+    # Start from \documentclass, or fall back to \begin{document} with the
+    # original resume's preamble spliced in
+    first_docclass = next((p for p in docclass_starts if lo <= p < hi), None)
+    first_begin = next((p for p in begin_starts if lo <= p < hi), None)
+    preamble = ""
+    if first_docclass is not None:
+        lo = first_docclass
+    elif first_begin is not None:
         # Model skipped preamble - use original resume's preamble
         print("WARNING: Response missing preamble, using original resume's preamble")
-        start = text.find('\\begin{document}')
-        body = text[start:]
-        
-        # Get preamble from original
-        preamble = extract_preamble_from_original(original_tex)
-        if preamble:
-            text = preamble + body
-        else:
-            text = body
-    
+        lo = first_begin
+        preamble = original_preamble
+
     # Remove any trailing text after \end{document}
-    end_doc_pattern = r'(\\end\{document\})'
-    match = re.search(end_doc_pattern, text, re.IGNORECASE)
-    if match:
-        text = text[:match.end()]
-    
+    first_end = next((end for start, end in end_spans if lo <= start < hi), None)
+    if first_end is not None:
+        hi = first_end
+
+    text = preamble + text[lo:hi].strip()
+
     # Validate we have a proper LaTeX document
-    if '\\documentclass' not in text and '\\begin{document}' not in text:
+    if first_docclass is None and first_begin is None:
         print(f"WARNING: Could not extract valid LaTeX. Response preview: {response_text[:500]}...")
         raise Exception(f"Could not extract valid LaTeX from API response. The model may not have returned proper LaTeX code.")
-    
+
     return text
 
 
-def calculate_fill_ratio(pdf_path):
+# Preflight patterns: balanced environments are the cheapest useful signal
+# that a model response is structurally compilable
+_BEGIN_ENV_RE = re.compile(r'\\begin\{([^}]+)\}')
+_END_ENV_RE = re.compile(r'\\end\{([^}]+)\}')
+
+
+def latex_structure_ok(tex_content):
+    """
+    Cheap structural check before paying for a pdflatex run: every
+    \\begin{...} needs a matching \\end{...}, the document environment must
+    be closed, and a resume should contain at least one \\section.
+    """
+    begins = Counter(_BEGIN_ENV_RE.findall(tex_content))
+    ends = Counter(_END_ENV_RE.findall(tex_content))
+    return begins == ends and 'document' in ends and '\\section' in tex_content
+
+
+def analyze_pdf(pdf_path):
     """
-    Calculate the page fill ratio using PyMuPDF.
-    Measures how much of the usable page area is filled with content.
+    Read page count and page fill ratio from a PDF in a single PyMuPDF open.
+    Fill ratio measures how much of the usable page area is filled with content.
     Target: 0.88 <= fill_ratio <= 0.96
+    Returns (page_count, fill_ratio).
     """
     try:
         import fitz  # PyMuPDF
-        doc = fitz.open(pdf_path)
-        page = doc[0]  # First page
-        
-        # Get page dimensions (letter size: 612 x 792 points)
-        page_rect = page.rect
-        page_height = page_rect.height
-        
-        # Get all text blocks
-        blocks = page.get_text("blocks")
-        if not blocks:
-            doc.close()
-            return 0.5  # Default if no content found
-        
-        # Find the top-most and bottom-most content
-        content_top = page_height  # Will find minimum y (top of content)
-        content_bottom = 0  # Will find maximum y (bottom of content)
-        
-        for block in blocks:
-            # block format: (x0, y0, x1, y1, text, block_no, block_type)
-            y0, y1 = block[1], block[3]
-            content_top = min(content_top, y0)
-            content_bottom = max(content_bottom, y1)
-        
-        doc.close()
-        
+        fitz.TOOLS.mupdf_display_errors(False)
+        with fitz.open(pdf_path) as doc:
+            page_count = doc.page_count
+            page = doc[0]  # First page
+
+            # Get page dimensions (letter size: 612 x 792 points)
+            page_rect = page.rect
+            page_height = page_rect.height
+
+            # Get text bounding boxes only — the bbox log carries (kind, rect)
+            # pairs, so no block text is decoded or marshaled into Python
+            try:
+                text_rects = [rect for kind, rect in page.get_bboxlog()
+                              if 'text' in kind and not kind.startswith('ignore')]
+            except AttributeError:
+                # Older PyMuPDF without get_bboxlog: rawdict with flags=0
+                # still skips text extraction and keeps only geometry
+                text_rects = [block['bbox']
+                              for block in page.get_text("rawdict", flags=0)["blocks"]]
+
+        # Release MuPDF's global store once the doc is closed so per-worker
+        # memory stays bounded under concurrent requests
+        fitz.TOOLS.store_shrink(100)
+
+        if not text_rects:
+            return page_count, 0.5  # Default if no content found
+
+        # Find the top-most and bottom-most content in one vectorized pass
+        # rect format: (x0, y0, x1, y1)
+        ys = np.array([(r[1], r[3]) for r in text_rects], dtype=np.float32)
+        content_top = float(ys[:, 0].min())  # Minimum y (top of content)
+        content_bottom = float(ys[:, 1].max())  # Maximum y (bottom of content)
+
         # For a resume with minimal margins (fullpage package + adjustments):
         # - Top margin is roughly 36-50pt (0.5-0.7 inches)
         # - Bottom margin is roughly 36-50pt
@@ -238,47 +378,185 @@ def calculate_fill_ratio(pdf_path):
         print(f"  Fill ratio debug: content_top={content_top:.0f}, content_bottom={content_bottom:.0f}, "
               f"page_height={page_height:.0f}, usable_height={usable_height:.0f}, ratio={fill_ratio:.2f}")
         
-        return min(max(fill_ratio, 0.0), 1.0)  # Clamp to 0-1
+        return page_count, min(max(fill_ratio, 0.0), 1.0)  # Clamp to 0-1
     except Exception as e:
-        print(f"Error calculating fill ratio: {e}")
-        return 0.9  # Default to middle of range
+        print(f"Error analyzing PDF: {e}")
+        return 1, 0.9  # Default to 1 page, middle of range
+
+
+# Pool for pdflatex runs. Compilation is CPU-bound and can take seconds per
+# attempt; running it in worker processes keeps the Flask worker thread free
+# to serve other requests.
+_LATEX_POOL = ProcessPoolExecutor(max_workers=os.cpu_count())
+
+# Measurement results keyed on a hash of the LaTeX source. The shorten/expand
+# retries sometimes return content identical to the previous attempt (e.g.
+# the model hit its token limit), which would otherwise recompile the exact
+# same document.
+_COMPILE_CACHE = {}  # (tex hash, draft) -> (page_count, fill_ratio)
+_COMPILE_CACHE_MAX = 8
+
+# Page count from a pdflatex log: the summary line when present, otherwise
+# the highest [n] shipout marker (draftmode runs still print these)
+_LOG_PAGES_RE = re.compile(r'Output written on .*\((\d+) pages?')
+_LOG_SHIPOUT_RE = re.compile(r'\[(\d+)[\]\s{]')
+
+
+def _tex_hash(tex_content):
+    """Short content hash used to detect unchanged LaTeX between attempts."""
+    return hashlib.blake2b(tex_content.encode('utf-8'), digest_size=16).digest()
+
+
+def _page_count_from_log(log_text):
+    """Parse the page count out of a pdflatex .log file."""
+    match = _LOG_PAGES_RE.search(log_text)
+    if match:
+        return int(match.group(1))
+    shipped = _LOG_SHIPOUT_RE.findall(log_text)
+    return max((int(n) for n in shipped), default=1)
+
 
+# Precompiled preamble format: a pdflatex .fmt with the resume's packages
+# already loaded, so each compile skips preamble processing entirely.
+_FMT_NAME = 'resumefmt'
+_preamble_fmt = {'hash': None, 'path': None}
 
-def compile_latex_to_pdf(tex_content, filename_stem, save_final=True):
+
+def _ensure_preamble_format(preamble):
+    """
+    Build (or reuse) a precompiled pdflatex format for the given preamble
+    using mylatexformat. Returns the .fmt path, or None if the format could
+    not be built (e.g. mylatexformat not installed) — compiles then just run
+    the preamble normally.
     """
-    Compile LaTeX content to PDF using pdflatex.
-    Returns (page_count, fill_ratio, final_path) if save_final=True, 
+    if not preamble:
+        return None
+    preamble_hash = hashlib.blake2b(preamble.encode('utf-8'), digest_size=16).hexdigest()
+    if _preamble_fmt['hash'] == preamble_hash:
+        return _preamble_fmt['path']
+
+    fmt_path = None
+    try:
+        with tempfile.TemporaryDirectory() as tmpdir:
+            src = Path(tmpdir) / 'preamble.tex'
+            src.write_text(preamble + '\n\\begin{document}\n\\end{document}\n', encoding='utf-8')
+            result = subprocess.run(
+                ["pdflatex", "-ini", "-interaction=nonstopmode",
+                 f"-jobname={_FMT_NAME}", "&pdflatex", "mylatexformat.ltx", src.name],
+                cwd=tmpdir,
+                capture_output=True,
+                text=True,
+                timeout=120
+            )
+            built = Path(tmpdir) / f"{_FMT_NAME}.fmt"
+            if result.returncode == 0 and built.exists():
+                fmt_path = UPLOAD_FOLDER / f"{_FMT_NAME}.fmt"
+                shutil.copy(built, fmt_path)
+                print(f"Precompiled preamble format: {fmt_path}")
+            else:
+                print("Could not precompile preamble format, compiling preamble per run")
+    except Exception as e:
+        print(f"Error building preamble format: {e}")
+        fmt_path = None
+
+    # Remember the outcome (including failure) so we don't retry every compile
+    _preamble_fmt['hash'] = preamble_hash
+    _preamble_fmt['path'] = fmt_path
+    return fmt_path
+
+
+def compile_latex_to_pdf(tex_content, filename_stem, save_final=True, draft=False):
+    """
+    Compile LaTeX content to PDF using pdflatex in a worker process.
+    Returns (page_count, fill_ratio, final_path) if save_final=True,
     else (page_count, fill_ratio, None).
+    With draft=True, pdflatex skips PDF shipout (-draftmode): page breaking
+    still happens, but no PDF exists to measure, so fill_ratio is None.
+    Measurement-only runs (save_final=False) are memoized on the content
+    hash; the final save always compiles so the PDF is written.
     """
+    tex_hash = _tex_hash(tex_content)
+    cache_key = (tex_hash, draft)
+    if not save_final and cache_key in _COMPILE_CACHE:
+        page_count, fill_ratio = _COMPILE_CACHE[cache_key]
+        return page_count, fill_ratio, None
+
+    # Only use the precompiled format when it was built from this exact
+    # preamble; _ensure_preamble_format memoizes on the preamble hash
+    fmt_path = _ensure_preamble_format(extract_preamble_from_original(tex_content))
+
+    page_count, fill_ratio, final_path = _LATEX_POOL.submit(
+        _compile_latex_worker, tex_content, filename_stem, save_final, draft,
+        str(fmt_path) if fmt_path else None
+    ).result()
+
+    if len(_COMPILE_CACHE) >= _COMPILE_CACHE_MAX:
+        _COMPILE_CACHE.pop(next(iter(_COMPILE_CACHE)))
+    _COMPILE_CACHE[cache_key] = (page_count, fill_ratio)
+    return page_count, fill_ratio, final_path
+
+
+def _compile_latex_worker(tex_content, filename_stem, save_final=True, draft=False,
+                          fmt_path=None):
+    """Actual pdflatex invocation; runs inside the process pool."""
     try:
         with tempfile.TemporaryDirectory() as tmpdir:
             tex_path = Path(tmpdir) / f"{filename_stem}.tex"
             tex_path.write_text(tex_content, encoding='utf-8')
 
+            cmd = ["pdflatex"]
+            if draft:
+                cmd.append("-draftmode")
+            if fmt_path:
+                # Precompiled preamble format; pdflatex picks it up from cwd
+                os.symlink(fmt_path, Path(tmpdir) / f"{_FMT_NAME}.fmt")
+                cmd.append(f"-fmt={_FMT_NAME}")
+            cmd += ["-interaction=nonstopmode", tex_path.name]
+
+            # Discard console output rather than piping megabytes of LaTeX
+            # chatter through Python on every successful compile; the .log
+            # file in the tmpdir carries the same diagnostics on failure
             result = subprocess.run(
-                ["pdflatex", "-interaction=nonstopmode", tex_path.name],
+                cmd,
                 cwd=tmpdir,
-                capture_output=True,
-                text=True,
+                stdout=subprocess.DEVNULL,
+                stderr=subprocess.DEVNULL,
                 timeout=120
             )
 
+            if result.returncode != 0 and fmt_path:
+                # The format may be stale or incompatible with this document;
+                # fall back to a plain compile before giving up
+                cmd = [c for c in cmd if not c.startswith("-fmt=")]
+                result = subprocess.run(
+                    cmd,
+                    cwd=tmpdir,
+                    stdout=subprocess.DEVNULL,
+                    stderr=subprocess.DEVNULL,
+                    timeout=120
+                )
+
             if result.returncode != 0:
-                error_message = result.stderr or result.stdout or "Unknown LaTeX compilation error"
-                raise Exception(f"LaTeX compilation failed: {error_message.strip()[:300]}")
+                log_path = Path(tmpdir) / f"{filename_stem}.log"
+                error_message = (
+                    log_path.read_text(encoding='utf-8', errors='ignore')
+                    if log_path.exists() else ""
+                ) or "Unknown LaTeX compilation error"
+                # The error sits at the end of the log, so keep the tail
+                raise Exception(f"LaTeX compilation failed: {error_message.strip()[-300:]}")
+
+            if draft:
+                # No PDF was shipped out; the log still records page breaks
+                log_path = Path(tmpdir) / f"{filename_stem}.log"
+                log_text = log_path.read_text(encoding='utf-8', errors='ignore') if log_path.exists() else ""
+                return _page_count_from_log(log_text), None, None
 
             pdf_path = Path(tmpdir) / f"{filename_stem}.pdf"
             if not pdf_path.exists():
                 raise Exception("LaTeX compilation did not produce a PDF file.")
 
-            # Get page count
-            import PyPDF2
-            with open(pdf_path, 'rb') as f:
-                reader = PyPDF2.PdfReader(f)
-                page_count = len(reader.pages)
-            
-            # Calculate fill ratio
-            fill_ratio = calculate_fill_ratio(str(pdf_path))
+            # Get page count and fill ratio in a single PDF open
+            page_count, fill_ratio = analyze_pdf(str(pdf_path))
 
             if not save_final:
                 return page_count, fill_ratio, None
@@ -376,29 +654,52 @@ def health_check():
 @app.route('/upload', methods=['POST'])
 def upload_file():
     """Handle resume file upload"""
-    if 'file' not in request.files:
-        return jsonify({"error": "No file provided"}), 400
-    
-    file = request.files['file']
-    
-    if file.filename == '':
-        return jsonify({"error": "No file selected"}), 400
-    
-    if not allowed_file(file.filename):
-        return jsonify({"error": "Only LaTeX (.tex) resumes are supported"}), 400
-    
-    filename = secure_filename(file.filename)
-    filepath = app.config['UPLOAD_FOLDER'] / filename
-    file.save(filepath)
+    # Fast path: raw body upload (application/octet-stream with the name in
+    # an X-Filename header). Streams the body straight to disk in 1 MiB
+    # chunks, bypassing Werkzeug's multipart parser and its in-memory buffer.
+    raw_filename = request.headers.get('X-Filename')
+    if raw_filename and 'file' not in request.files:
+        filename = secure_filename(raw_filename)
+        if not allowed_file(filename):
+            return jsonify({"error": "Only LaTeX (.tex) resumes are supported"}), 400
+        filepath = app.config['UPLOAD_FOLDER'] / filename
+        part_path = filepath.with_name(filepath.name + '.part')
+        try:
+            with open(part_path, 'wb') as f:
+                shutil.copyfileobj(request.stream, f, length=1024 * 1024)
+            os.replace(part_path, filepath)
+        except Exception as e:
+            part_path.unlink(missing_ok=True)
+            return jsonify({"error": str(e)}), 500
+    else:
+        # Fallback: regular multipart form upload
+        if 'file' not in request.files:
+            return jsonify({"error": "No file provided"}), 400
+
+        file = request.files['file']
+
+        if file.filename == '':
+            return jsonify({"error": "No file selected"}), 400
+
+        if not allowed_file(file.filename):
+            return jsonify({"error": "Only LaTeX (.tex) resumes are supported"}), 400
+
+        filename = secure_filename(file.filename)
+        filepath = app.config['UPLOAD_FOLDER'] / filename
+        file.save(filepath)
     try:
         content = extract_tex_text(filepath)
-        current_resume['content'] = content
+
+        # Persist to disk so it loads automatically next time, then remap
+        # the shared content from the saved file
+        save_resume_to_disk(content)
+        _mmap_saved_resume()
         current_resume['filename'] = filename
         current_resume['file_type'] = 'tex'
-        
-        # Persist to disk so it loads automatically next time
-        save_resume_to_disk(content)
-        
+
+        # Warm the preamble format so the first /tailor doesn't pay for it
+        _ensure_preamble_format(current_resume['preamble'])
+
         return jsonify({
             "success": True,
             "filename": filename,
@@ -419,11 +720,28 @@ def tailor_resume():
     if not data or 'job_description' not in data:
         return jsonify({"error": "No job description provided"}), 400
     
-    if not current_resume['content']:
+    if not resume_loaded():
         return jsonify({"error": "No resume uploaded. Please upload a resume first."}), 400
-    
+
     job_description = data['job_description']
+    original_content = resume_content()
+    original_preamble = current_resume['preamble']
     rag_context = load_rag_context()
+    filename_stem = Path(current_resume['filename']).stem or "resume"
+
+    # Measure the uploaded resume once so the first prompt already carries a
+    # concrete length target instead of discovering it through retry round
+    # trips. The result is cached on the content hash, so repeat /tailor
+    # calls don't recompile the original.
+    baseline_hint = ""
+    try:
+        base_pages, base_fill, _ = compile_latex_to_pdf(original_content, filename_stem, save_final=False)
+        baseline_hint = f"""
+
+## Length Calibration:
+The original resume above compiles to {base_pages} page(s) with a page fill ratio of {base_fill:.2f} (target: 0.88-0.96, exactly 1 page). Produce a similar total amount of content: noticeably more and the resume spills to a second page, noticeably less and the page looks empty."""
+    except Exception as e:
+        print(f"Skipping baseline fill measurement: {e}")
     
     # Build the system prompt
     system_prompt = """You are a resume tailoring assistant optimizing for BOTH ATS systems AND human recruiters. Your goal is to make the candidate appear as a strong fit for the role. You can embellish and reframe experiences generously, but stay grounded in the candidate's actual background.
@@ -464,13 +782,13 @@ CORE DIRECTIVES:
 
     # Build the user prompt with RAG context
     prompt = f"""## Current Resume:
-{current_resume['content']}
+{original_content}
 
 ## Additional Background Information (use this to swap in relevant experiences/skills):
 {rag_context if rag_context else "No additional context provided."}
 
 ## Job Description to Tailor For:
-{job_description}
+{job_description}{baseline_hint}
 
 ## Instructions:
 Rewrite this resume so every qualification from the job description feels DEMONSTRATED through the narrative:
@@ -501,26 +819,61 @@ CRITICAL OUTPUT FORMAT: Return ONLY the raw LaTeX code starting with \\documentc
         
         # Extract pure LaTeX from the response (strip markdown fences, explanatory text, etc.)
         # Pass original resume so we can use its preamble if the response is missing it
-        tailored_content = extract_latex_from_response(raw_response, current_resume['content'])
+        tailored_content = extract_latex_from_response(raw_response, original_preamble)
         
         # Debug: log the extracted content
         print("EXTRACTED LATEX (first 500 chars):")
         print(tailored_content[:500])
         print("=" * 50)
         
-        filename_stem = Path(current_resume['filename']).stem or "resume"
-        
         # Target fill ratio range
         MIN_FILL_RATIO = 0.88
         MAX_FILL_RATIO = 0.96
-        max_optimization_attempts = 5
+        # The initial prompt already carries the length calibration, so two
+        # corrective round trips are enough for stragglers
+        max_optimization_attempts = 2
         adjustment_count = 0
         adjustment_type = None  # 'shortened' or 'expanded'
-        
+        last_tex_hash = None
+        prev_overlong = False
+
         for attempt in range(max_optimization_attempts + 1):
-            page_count, fill_ratio, _ = compile_latex_to_pdf(tailored_content, filename_stem, save_final=False)
-            print(f"Optimization check #{attempt}: {page_count} page(s), fill ratio: {fill_ratio:.2f}")
-            
+            tex_hash = _tex_hash(tailored_content)
+            if tex_hash == last_tex_hash:
+                print("  → Model returned unchanged content, stopping optimization")
+                break
+            last_tex_hash = tex_hash
+
+            # Reject structurally broken responses before shelling out to
+            # pdflatex; on the last attempt let the compiler report the error
+            if not latex_structure_ok(tailored_content) and attempt < max_optimization_attempts:
+                print("  → Response failed LaTeX preflight (unbalanced/missing environments), re-prompting...")
+                adjustment_count += 1
+                adjustment_type = 'shortened'
+                tailored_content = shorten_resume(
+                    tailored_content,
+                    original_preamble,
+                    job_description,
+                    1.0
+                )
+                continue
+
+            if prev_overlong:
+                # Still fighting the page count: a cheap -draftmode run skips
+                # PDF shipout and only reports page breaks
+                page_count, fill_ratio, _ = compile_latex_to_pdf(
+                    tailored_content, filename_stem, save_final=False, draft=True)
+                if page_count == 1:
+                    # Back to one page; full compile to measure the fill ratio
+                    page_count, fill_ratio, _ = compile_latex_to_pdf(
+                        tailored_content, filename_stem, save_final=False)
+            else:
+                page_count, fill_ratio, _ = compile_latex_to_pdf(
+                    tailored_content, filename_stem, save_final=False)
+            prev_overlong = page_count > 1
+            fill_desc = "n/a" if fill_ratio is None else f"{fill_ratio:.2f}"
+            print(f"Optimization check #{attempt}: {page_count} page(s), fill ratio: {fill_desc}")
+
             # Hard constraint: must be 1 page
             if page_count > 1:
                 print(f"  → Too long ({page_count} pages), shortening...")
@@ -529,9 +882,9 @@ CRITICAL OUTPUT FORMAT: Return ONLY the raw LaTeX code starting with \\documentc
                     adjustment_type = 'shortened'
                     tailored_content = shorten_resume(
                         tailored_content,
-                        current_resume['content'],
+                        original_preamble,
                         job_description,
-                        fill_ratio
+                        fill_ratio if fill_ratio is not None else 1.0
                     )
                     continue
                 else:
@@ -546,7 +899,7 @@ CRITICAL OUTPUT FORMAT: Return ONLY the raw LaTeX code starting with \\documentc
                     adjustment_type = 'expanded'
                     tailored_content = expand_resume(
                         tailored_content,
-                        current_resume['content'],
+                        original_preamble,
                         job_description,
                         fill_ratio
                     )
@@ -558,7 +911,7 @@ CRITICAL OUTPUT FORMAT: Return ONLY the raw LaTeX code starting with \\documentc
                     adjustment_type = 'shortened'
                     tailored_content = shorten_resume(
                         tailored_content,
-                        current_resume['content'],
+                        original_preamble,
                         job_description,
                         fill_ratio
                     )
@@ -611,6 +964,7 @@ def update_rag_context():
     try:
         with open(RAG_FILE, 'w', encoding='utf-8') as file:
             file.write(data['context'])
+        _RAG_CACHE.clear()
         return jsonify({"success": True})
     except Exception as e:
         return jsonify({"error": str(e)}), 500
@@ -619,14 +973,14 @@ def update_rag_context():
 @app.route('/current-resume', methods=['GET'])
 def get_current_resume():
     """Get currently loaded resume"""
-    if not current_resume['content']:
+    if not resume_loaded():
         return jsonify({"loaded": False})
-    
+
     return jsonify({
         "loaded": True,
         "filename": current_resume['filename'],
         "file_type": current_resume['file_type'],
-        "preview": current_resume['content'][:500] + "..." if len(current_resume['content']) > 500 else current_resume['content'],
+        "preview": resume_preview(),
         "persisted": SAVED_RESUME_FILE.exists()
     })
 
@@ -634,6 +988,14 @@ def get_current_resume():
 @app.route('/compiled/<path:filename>', methods=['GET'])
 def download_compiled_pdf(filename):
     """Serve compiled PDF files."""
+    if COMPILED_ACCEL_PREFIX:
+        # Let nginx serve the bytes from disk; the worker is freed as soon
+        # as the headers are returned
+        safe_name = secure_filename(filename)
+        response = Response(status=200, mimetype='application/pdf')
+        response.headers['X-Accel-Redirect'] = f"{COMPILED_ACCEL_PREFIX}/{safe_name}"
+        response.headers['Content-Disposition'] = f'attachment; filename="{safe_name}"'
+        return response
     return send_from_directory(COMPILED_FOLDER, filename, as_attachment=True)
 
 
@@ -14,24 +14,30 @@ except ImportError:
     os.system("pip install Pillow")
     from PIL import Image, ImageDraw
 
+try:
+    import numpy as np
+except ImportError:
+    print("Installing NumPy...")
+    os.system("pip install numpy")
+    import numpy as np
+
 def create_icon(size):
     """Create a simple gradient icon with a document symbol"""
-    img = Image.new('RGBA', (size, size), (0, 0, 0, 0))
-    draw = ImageDraw.Draw(img)
-    
-    # Background circle with gradient effect
     padding = size // 8
-    
-    # Coral to teal gradient simulation
-    for i in range(size - 2 * padding):
-        ratio = i / (size - 2 * padding)
-        r = int(255 * (1 - ratio * 0.7))
-        g = int(107 + (205 - 107) * ratio)
-        b = int(107 + (196 - 107) * ratio)
-        
-        y = padding + i
-        draw.line([(padding, y), (size - padding, y)], fill=(r, g, b, 255))
-    
+    span = size - 2 * padding
+
+    # Coral to teal gradient simulation, computed as one vertical ramp and
+    # broadcast across the rows instead of drawing line-by-line
+    ratio = np.linspace(0, 1, span, endpoint=False, dtype=np.float32)
+    r = (255 * (1 - ratio * 0.7)).astype(np.uint8)
+    g = (107 + (205 - 107) * ratio).astype(np.uint8)
+    b = (107 + (196 - 107) * ratio).astype(np.uint8)
+    rows = np.stack([r, g, b, np.full_like(r, 255)], axis=1)  # (span, RGBA)
+
+    arr = np.zeros((size, size, 4), dtype=np.uint8)
+    arr[padding:padding + span, padding:padding + span] = rows[:, np.newaxis, :]
+    img = Image.fromarray(arr, 'RGBA')
+
     # Create rounded rectangle mask
     mask = Image.new('L', (size, size), 0)
     mask_draw = ImageDraw.Draw(mask)